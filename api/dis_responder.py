@@ -2,9 +2,13 @@
     UI and REST API for Data and Information Services
 '''
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache, wraps
+import hashlib
 import inspect
-from json import JSONEncoder
+from itertools import chain
 from operator import attrgetter
 import os
 import random
@@ -13,10 +17,20 @@ import string
 import sys
 from time import time
 import bson
-from flask import (Flask, make_response, render_template, request, jsonify, send_file)
+from flask import (Flask, make_response, render_template, request, jsonify, send_file,
+                   stream_with_context)
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_swagger import swagger
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from pymongo.errors import OperationFailure
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from werkzeug.http import http_date
 import jrc_common.jrc_common as JRC
 import doi_common.doi_common as DL
 
@@ -25,6 +39,57 @@ import doi_common.doi_common as DL
 __version__ = "4.7.0"
 # Database
 DB = {}
+# Request counts by endpoint
+ENDPOINTS = Counter()
+# Projections: Crossref reference lists and other unrendered fields make up
+# most of a DOI record, so drop them when fetching DOIs for display.
+DOI_PROJECTION = {"_id": 0, "reference": 0, "relatedIdentifiers": 0, "license": 0, "link": 0,
+                  "funder": 0, "assertion": 0, "fundingReferences": 0}
+# Citations, author lists and components don't show the abstract either
+CITATION_PROJECTION = {**DOI_PROJECTION, "abstract": 0}
+USER_PROJECTION = {"_id": 0, "orcid": 1, "employeeId": 1, "given": 1, "family": 1}
+# Collations: English sort order, and case-insensitive comparison for names
+# (the latter matches the family_ci and given_ci indexes)
+EN_COLLATION = {"locale": "en"}
+NAME_COLLATION = {"locale": "en", "strength": 2}
+# ORCID ID
+ORCID_RE = re.compile(r'([0-9A-Z]{4}-){3}[0-9A-Z]+')
+# Documents per cursor batch for potentially large result sets
+BATCH_SIZE = 500
+# Caching (default time to live in seconds)
+CACHE_TTL = 300
+# Downloadable files (directory, seconds to keep them, characters for generated names)
+DOWNLOAD_DIR = "/tmp/dis_downloads"
+DOWNLOAD_TTL = 3600
+RANDOM_CHARS = string.ascii_letters + string.digits
+# JSON serialization (datetimes are passed through to CustomJSONProvider so they
+# are HTTP dates, and keys are sorted to match Flask's JSON provider)
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME \
+                 | orjson.OPT_SORT_KEYS if orjson else 0
+# ORCID API session (reuses connections, retries transient failures)
+ORCID_SESSION = requests.Session()
+ORCID_SESSION.mount("https://", HTTPAdapter(pool_maxsize=10,
+                                            max_retries=Retry(total=2, backoff_factor=0.1,
+                                                              status_forcelist=(502, 503, 504))))
+# Table headers (through the opening tbody tag)
+TABLE_HEAD = {"papers": '<table id="papers" class="tablesorter standard"><thead><tr>' \
+                      + '<th>Published</th><th>DOI</th><th>Title</th></tr></thead><tbody>',
+              "user": '<table id="ops" class="tablesorter standard"><thead><tr><th>ORCID</th>' \
+                    + '<th>Given name</th><th>Family name</th></tr></thead><tbody>',
+              "type": '<table id="types" class="tablesorter standard"><thead><tr><th>Source</th>' \
+                    + '<th>Type</th><th>Subtype</th><th>Count</th></tr></thead><tbody>',
+              "publisher": '<table id="types" class="tablesorter standard"><thead><tr>' \
+                         + '<th>Publisher</th><th>Count</th></tr></thead><tbody>',
+              "tag": '<table id="types" class="tablesorter standard"><thead><tr>' \
+                   + '<th>Tag</th><th>Count</th></tr></thead><tbody>',
+              "affiliation": '<table id="types" class="tablesorter standard"><thead><tr>' \
+                           + '<th>Affiliation</th><th>Count</th></tr></thead><tbody>',
+              "collection": '<table id="collections" class="tablesorter standard"><thead><tr>' \
+                          + '<th>Collection</th><th>Documents</th><th>Size</th>' \
+                          + '<th>Free space</th><th>Indices</th></tr></thead><tbody>',
+              "group": '<table class="standard"><thead><tr><th>Name</th><th>ORCID</th>' \
+                     + '<th>Group</th><th>Affiliations</th></tr></thead><tbody>'
+             }
 # Navigation
 NAV = {"Home": "",
        "DOIs": {"DOIs by type": "dois_type",
@@ -42,27 +107,39 @@ NAV = {"Home": "",
 # * Classes                                                                    *
 # ******************************************************************************
 
-class CustomJSONEncoder(JSONEncoder):
-    ''' Define a custom JSON encoder
+class CustomJSONProvider(DefaultJSONProvider):
+    ''' Define a custom JSON provider
     '''
-    def default(self, o):
-        try:
-            if isinstance(o, bson.objectid.ObjectId):
-                return str(o)
-            if isinstance(o, datetime):
-                return o.strftime("%a, %-d %b %Y %H:%M:%S")
-            if isinstance(o, timedelta):
-                seconds = o.total_seconds()
-                hours = seconds // 3600
-                minutes = (seconds % 3600) // 60
-                seconds = seconds % 60
-                return f"{hours:02d}:{minutes:02d}:{seconds:.02f}"
-            iterable = iter(o)
-        except TypeError:
-            pass
-        else:
-            return list(iterable)
-        return JSONEncoder.default(self, o)
+    @staticmethod
+    def timedelta_string(o):
+        ''' Format a timedelta as HH:MM:SS.ss
+        '''
+        seconds = o.total_seconds()
+        hours = int(seconds // 3600)
+        minutes = int((seconds % 3600) // 60)
+        seconds = seconds % 60
+        return f"{hours:02d}:{minutes:02d}:{seconds:.02f}"
+
+    # Encoders keyed by exact type (datetimes are HTTP dates, as in DefaultJSONProvider)
+    encoders = {bson.objectid.ObjectId: str,
+                datetime: http_date,
+                timedelta: timedelta_string}
+
+    @classmethod
+    def default(cls, o):
+        ''' Encode types the standard encoder can't. Dispatch is a single lookup
+            on the exact type; subclasses of registered types fall back to
+            isinstance checks.
+        '''
+        encoder = cls.encoders.get(type(o))
+        if encoder:
+            return encoder(o)
+        for otype, encoder in cls.encoders.items():
+            if isinstance(o, otype):
+                return encoder(o)
+        if hasattr(o, '__iter__'):
+            return list(o)
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
 
 
 class InvalidUsage(Exception):
@@ -102,36 +179,45 @@ class CustomException(Exception):
 # ******************************************************************************
 
 app = Flask(__name__, template_folder="templates")
-app.json_encoder = CustomJSONEncoder
+app.json = CustomJSONProvider(app)
 app.config.from_pyfile("config.cfg")
 CORS(app, supports_credentials=True)
-app.json_encoder = CustomJSONEncoder
 app.config["STARTDT"] = datetime.now()
 app.config["LAST_TRANSACTION"] = time()
 
 
+def initialize_database():
+    ''' Connect to the DIS database. This runs once per process at import (once
+        per gunicorn worker); a worker that can't connect exits rather than
+        serve errors.
+        Keyword arguments:
+          None
+        Returns:
+          None
+    '''
+    try:
+        dbconfig = JRC.get_config("databases")
+    except Exception as err:
+        print(f"Config error: {err}")
+        sys.exit(-1)
+    dbo = attrgetter("dis.prod.read")(dbconfig)
+    print(f"Connecting to {dbo.name} prod on {dbo.host} as {dbo.user}")
+    try:
+        DB['dis'] = JRC.connect_database(dbo)
+    except Exception as err:
+        print(f"Database connect error: {err}")
+        sys.exit(-1)
+
+
+initialize_database()
+
+
 @app.before_request
 def before_request():
     ''' Set transaction start time and increment counters.
-        If needed, initilize global variables.
     '''
-    if not DB:
-        try:
-            dbconfig = JRC.get_config("databases")
-        except Exception as err:
-            return render_template('warning.html', urlroot=request.url_root,
-                                   title=render_warning("Config error"), message=err)
-        dbo = attrgetter("dis.prod.read")(dbconfig)
-        print(f"Connecting to {dbo.name} prod on {dbo.host} as {dbo.user}")
-        try:
-            DB['dis'] = JRC.connect_database(dbo)
-        except Exception as err:
-            return render_template('warning.html', urlroot=request.url_root,
-                                   title=render_warning("Database connect error"), message=err)
     app.config["START_TIME"] = time()
-    app.config["COUNTER"] += 1
-    endpoint = request.endpoint if request.endpoint else "(Unknown)"
-    app.config["ENDPOINTS"][endpoint] = app.config["ENDPOINTS"].get(endpoint, 0) + 1
+    ENDPOINTS[request.endpoint or "(Unknown)"] += 1
     if request.method == "OPTIONS":
         result = initialize_result()
         return generate_response(result)
@@ -213,16 +299,20 @@ def render_warning(msg, severity='error', size='lg'):
 # * Navigation utility functions                                               *
 # ******************************************************************************
 
+@lru_cache(maxsize=None)
 def generate_navbar(active):
-    ''' Generate the web navigation bar
+    ''' Generate the web navigation bar. NAV is static, so the HTML is only
+        built once per active heading.
         Keyword arguments:
+          active: active heading
+        Returns:
           Navigation bar
     '''
-    nav = '''
+    nav = ['''
     <nav class="navbar navbar-expand-lg navbar-dark bg-dark">
       <div class="collapse navbar-collapse" id="navbarSupportedContent">
         <ul class="navbar-nav mr-auto">
-    '''
+    ''']
     for heading, subhead in NAV.items():
         basic = '<li class="nav-item active">' if heading == active else '<li class="nav-item">'
         drop = '<li class="nav-item dropdown active">' if heading == active \
@@ -232,17 +322,17 @@ def generate_navbar(active):
                    + f"aria-expanded=\"false\">{heading}</a><div class=\"dropdown-menu\" "\
                    + 'aria-labelledby="navbarDropdown">'
         if subhead:
-            nav += drop + menuhead
+            nav.append(drop + menuhead)
             for itm, val in subhead.items():
                 link = f"/{val}" if val else ('/' + itm.replace(" ", "_")).lower()
-                nav += f"<a class='dropdown-item' href='{link}'>{itm}</a>"
-            nav += '</div></li>'
+                nav.append(f"<a class='dropdown-item' href='{link}'>{itm}</a>")
+            nav.append('</div></li>')
         else:
-            nav += basic
+            nav.append(basic)
             link = ('/' + heading.replace(" ", "_")).lower()
-            nav += f"<a class='nav-link' href='{link}'>{heading}</a></li>"
-    nav += '</ul></div></nav>'
-    return nav
+            nav.append(f"<a class='nav-link' href='{link}'>{heading}</a></li>")
+    nav.append('</ul></div></nav>')
+    return "".join(nav)
 
 # ******************************************************************************
 # * Payload utility functions                                                  *
@@ -269,6 +359,16 @@ def receive_payload():
     return pay
 
 
+def count_only_requested():
+    ''' Check the count_only query parameter
+        Keyword arguments:
+          None
+        Returns:
+          True if count_only is set to a true value (1, true, or yes)
+    '''
+    return request.args.get('count_only', '').lower() in ('1', 'true', 'yes')
+
+
 def initialize_result():
     ''' Initialize the result dictionary
         An auth header with a JWT token is required for all POST and DELETE requests
@@ -288,20 +388,176 @@ def initialize_result():
     return result
 
 
-def generate_response(result):
+def encode_json(obj):
+    ''' Serialize an object to JSON
+        Keyword arguments:
+          obj: object to serialize
+        Returns:
+          JSON as bytes
+    '''
+    if orjson:
+        return orjson.dumps(obj, default=CustomJSONProvider.default, option=ORJSON_OPTIONS)
+    return app.json.dumps(obj).encode()
+
+
+def generate_response(result, etag=False):
     ''' Generate a response to a request
         Keyword arguments:
           result: result dictionary
+          etag: add an ETag and honor If-None-Match
         Returns:
           JSON response
     '''
+    # Each top-level value is serialized once. The rest block varies per request,
+    # so the ETag is a hash of everything else, and the body reuses the same bytes.
+    parts = {key: encode_json(val) for key, val in result.items() if key != 'rest'}
+    tag = None
+    if etag:
+        tag = hashlib.blake2b(b",".join(encode_json(key) + b":" + parts[key]
+                                        for key in sorted(parts)),
+                              digest_size=16).hexdigest()
+        # If-None-Match uses the weak comparison (nginx weakens ETags it gzips)
+        if request.if_none_match.contains_weak(tag):
+            resp = app.response_class(status=304)
+            resp.set_etag(tag)
+            return resp
     result["rest"]["elapsed_time"] = str(timedelta(seconds=time() - app.config["START_TIME"]))
-    return jsonify(**result)
+    parts['rest'] = encode_json(result['rest'])
+    body = b"{" + b",".join(encode_json(key) + b":" + parts[key] for key in sorted(parts)) + b"}"
+    resp = app.response_class(body, mimetype="application/json")
+    if tag:
+        resp.set_etag(tag)
+    return resp
+
+
+def stream_response(result, rows):
+    ''' Generate a streaming response to a request. Rows are serialized into
+        the data list as they are read, and the rest of the result (with the
+        final row_count and elapsed_time) follows the last row.
+        Keyword arguments:
+          result: result dictionary
+          rows: iterable of rows (e.g. a cursor)
+        Returns:
+          Streaming JSON response
+    '''
+    def generate():
+        yield b'{"data":['
+        for row in rows:
+            if result['rest']['row_count']:
+                yield b','
+            yield encode_json(row)
+            result['rest']['row_count'] += 1
+        result["rest"]["elapsed_time"] = str(timedelta(seconds=time() - app.config["START_TIME"]))
+        # Drop the opening brace so the remaining keys continue the object
+        yield b'],' + encode_json({key: val for key, val in result.items() if key != 'data'})[1:]
+    return app.response_class(stream_with_context(generate()), mimetype="application/json")
+
+# ******************************************************************************
+# * Cache utility functions                                                    *
+# ******************************************************************************
+
+def ttl_cache(ttl=CACHE_TTL, maxsize=128):
+    ''' Decorator to cache a function's results for a limited time. Results
+        expire at the end of the current ttl-second window. Each gunicorn
+        worker has its own cache, so the TTL is the only invalidation.
+        Keyword arguments:
+          ttl: time to live (seconds)
+          maxsize: maximum number of cached results
+        Returns:
+          Decorator
+    '''
+    def decorator(func):
+        @lru_cache(maxsize=maxsize)
+        def cached(_, *args):
+            return func(*args)
+
+        @wraps(func)
+        def wrapper(*args):
+            return cached(int(time() // ttl), *args)
+        return wrapper
+    return decorator
 
 # ******************************************************************************
 # * ORCID utility functions                                                    *
 # ******************************************************************************
 
+@ttl_cache(60, maxsize=4096)
+def lookup_orcid(oid, field):
+    ''' Find a single record in the orcid collection
+        Keyword arguments:
+          oid: ORCID or employeeId
+          field: field to search (orcid or employeeId)
+        Returns:
+          orcid collection record
+    '''
+    return DL.single_orcid_lookup(oid, DB['dis'].orcid, field)
+
+
+@ttl_cache(maxsize=256)
+def get_orcid_record(oid):
+    ''' Get a record from the ORCID public API
+        Keyword arguments:
+          oid: ORCID ID
+        Returns:
+          ORCID record (or the API's error body if the ORCID ID wasn't found)
+    '''
+    resp = ORCID_SESSION.get(f"https://pub.orcid.org/v3.0/{oid}",
+                             headers={"Accept": "application/json"}, timeout=10)
+    # Any other status (rate limiting, server errors) raises, so it isn't cached
+    if resp.status_code not in (200, 404):
+        raise requests.HTTPError(f"ORCID API returned status {resp.status_code} for {oid}",
+                                 response=resp)
+    return resp.json()
+
+
+@ttl_cache()
+def count_affiliations():
+    ''' Count orcid records by affiliation
+        Keyword arguments:
+          None
+        Returns:
+          List of counts, sorted by affiliation
+    '''
+    payload = [{"$project": {"_id": 0, "affiliations": 1}},
+               {"$unwind" : "$affiliations"},
+               {"$group": {"_id": "$affiliations", "count":{"$sum": 1}}},
+               {"$sort": {"_id": 1}}
+              ]
+    return list(DB['dis'].orcid.aggregate(payload))
+
+
+@ttl_cache(maxsize=256)
+def get_affiliated_users(aff):
+    ''' Get the orcid records with a given affiliation
+        Keyword arguments:
+          aff: affiliation
+        Returns:
+          List of orcid records, sorted by family name
+    '''
+    return list(DB['dis'].orcid.find({"affiliations": aff}, USER_PROJECTION) \
+                               .collation(EN_COLLATION).sort("family", 1))
+
+
+def text_search_names(name):
+    ''' Find orcid records by name with the given/family text index
+        Keyword arguments:
+          name: search term
+        Returns:
+          First matching record (or None) and a cursor over the rest
+    '''
+    projection = {**USER_PROJECTION, "score": {"$meta": "textScore"}}
+    try:
+        rows = DB['dis'].orcid.find({"$text": {"$search": name}}, projection) \
+                              .sort([("score", {"$meta": "textScore"}), ("family", 1)]) \
+                              .batch_size(BATCH_SIZE)
+        return next(rows, None), rows
+    except OperationFailure as err:
+        # IndexNotFound: the text index hasn't been created on this database
+        if err.code == 27:
+            return None, None
+        raise
+
+
 def get_work_publication_date(wsumm):
     ''' Get a publication date from an ORCID work summary
         Keyword arguments:
@@ -310,14 +566,13 @@ def get_work_publication_date(wsumm):
           Publication date
     '''
     date = ''
-    if 'publication-date' in wsumm and wsumm['publication-date']:
-        ppd = wsumm['publication-date']
-        if 'year' in ppd and ppd['year']['value']:
-            date = ppd['year']['value']
-        if 'month' in ppd and ppd['month'] and ppd['month']['value']:
-            date += f"-{ppd['month']['value']}"
-        if 'day' in ppd and ppd['day'] and ppd['day']['value']:
-            date += f"-{ppd['day']['value']}"
+    if ppd := wsumm.get('publication-date'):
+        if (year := ppd.get('year')) and year['value']:
+            date = year['value']
+        if (month := ppd.get('month')) and month['value']:
+            date += f"-{month['value']}"
+        if (day := ppd.get('day')) and day['value']:
+            date += f"-{day['value']}"
     return date
 
 
@@ -328,15 +583,13 @@ def get_work_doi(work):
         Returns:
           DOI
     '''
-    if not work['external-ids']['external-id']:
-        return ''
-    for eid in work['external-ids']['external-id']:
-        if eid['external-id-type'] != 'doi':
+    for eid in (work.get('external-ids') or {}).get('external-id') or []:
+        if eid.get('external-id-type') != 'doi':
             continue
-        if 'external-id-normalized' in eid:
-            return eid['external-id-normalized']['value']
-        if 'external-id-value' in eid:
-            return eid['external-id-url']['value']
+        if norm := eid.get('external-id-normalized'):
+            return norm['value']
+        if val := eid.get('external-id-value'):
+            return val
     return ''
 
 
@@ -347,32 +600,32 @@ def get_orcid_from_db(oid, use_eid=False):
         Returns:
           HTML and a list of DOIs
     '''
-    print("Lookup ORCID")
     try:
-        orc = DL.single_orcid_lookup(oid, DB['dis'].orcid, 'employeeId' if use_eid else 'orcid')
+        orc = lookup_orcid(oid, 'employeeId' if use_eid else 'orcid')
     except Exception as err:
         raise CustomException(err, "Could not find_one in orcid collection by ORCID ID.") from err
     if not orc:
         return "", []
-    badges = add_orcid_badges(orc)
-    html = " ".join(badges)
-    html += "<br><table class='borderless'>"
-    html += f"<tr><td>Given name:</td><td>{', '.join(sorted(orc['given']))}</td></tr>"
-    html += f"<tr><td>Family name:</td><td>{', '.join(sorted(orc['family']))}</td></tr>"
+    html = [add_orcid_badges(orc), "<br><table class='borderless'>",
+            f"<tr><td>Given name:</td><td>{', '.join(sorted(orc['given']))}</td></tr>",
+            f"<tr><td>Family name:</td><td>{', '.join(sorted(orc['family']))}</td></tr>"]
     if 'employeeId' in orc:
         link = "<a href='" + f"{app.config['WORKDAY']}{orc['userIdO365']}" \
                + f"' target='_blank'>{orc['employeeId']}</a>"
-        html += f"<tr><td>Employee ID:</td><td>{link}</td></tr>"
+        html.append(f"<tr><td>Employee ID:</td><td>{link}</td></tr>")
     if 'affiliations' in orc:
-        html += f"<tr><td>Affiliations:</td><td>{', '.join(orc['affiliations'])}</td></tr>"
-    html += "</table><br>"
-    payload = {"$and": [{"$or": [{"author.given": {"$in": orc['given']}},
-                                 {"creators.givenName": {"$in": orc['given']}}]},
-                        {"$or": [{"author.family": {"$in": orc['family']}},
-                                 {"creators.familyName": {"$in": orc['family']}}]}]
+        html.append(f"<tr><td>Affiliations:</td><td>{', '.join(orc['affiliations'])}</td></tr>")
+    html.append("</table><br>")
+    # Each branch can be served by a compound index on the author (or creator)
+    # given and family names.
+    payload = {"$or": [{"author": {"$elemMatch": {"given": {"$in": orc['given']},
+                                                  "family": {"$in": orc['family']}}}},
+                       {"creators": {"$elemMatch": {"givenName": {"$in": orc['given']},
+                                                    "familyName": {"$in": orc['family']}}}}]
               }
     try:
-        rows = DB['dis'].dois.find(payload)
+        rows = DB['dis'].dois.find(payload, CITATION_PROJECTION) \
+                             .batch_size(BATCH_SIZE)
     except Exception as err:
         raise CustomException(err, "Could not find in dois collection by name.") from err
     works = []
@@ -390,17 +643,15 @@ def get_orcid_from_db(oid, use_eid=False):
                   }
         works.append(payload)
     if not works:
-        return html, []
-    html += '<table id="papers" class="tablesorter standard"><thead><tr>' \
-            + '<th>Published</th><th>DOI</th><th>Title</th>' \
-            + '</tr></thead><tbody>'
-
+        return "".join(html), []
+    html.append(TABLE_HEAD['papers'])
     for work in sorted(works, key=lambda row: row['date'], reverse=True):
-        html += f"<tr><td>{work['date']}</td><td>{work['doi'] if work['doi'] else '&nbsp;'}</td>" \
-                + f"<td>{work['title']}</td></tr>"
+        html.append(f"<tr><td>{work['date']}</td>" \
+                    + f"<td>{work['doi'] if work['doi'] else '&nbsp;'}</td>" \
+                    + f"<td>{work['title']}</td></tr>")
     if dois:
-        html += "</tbody></table>"
-    return html, dois
+        html.append("</tbody></table>")
+    return "".join(html), dois
 
 
 def add_orcid_works(data, dois):
@@ -411,7 +662,7 @@ def add_orcid_works(data, dois):
         Returns:
           HTML for a list of works from ORCID
     '''
-    html = inner = ""
+    inner = []
     for work in data['activities-summary']['works']['group']:
         wsumm = work['work-summary'][0]
         date = get_work_publication_date(wsumm)
@@ -419,33 +670,28 @@ def add_orcid_works(data, dois):
         if (not doi) or (doi in dois):
             continue
         if not doi:
-            inner += f"<tr><td>{date}</td><td>&nbsp;</td>" \
-                     + f"<td>{wsumm['title']['title']['value']}</td></tr>"
+            inner.append(f"<tr><td>{date}</td><td>&nbsp;</td>" \
+                         + f"<td>{wsumm['title']['title']['value']}</td></tr>")
             continue
-        if work['external-ids']['external-id'][0]['external-id-url']:
-            if work['external-ids']['external-id'][0]['external-id-url']:
-                link = "<a href='" \
-                       + work['external-ids']['external-id'][0]['external-id-url']['value'] \
-                       + f"' target='_blank'>{doi}</a>"
+        if url := work['external-ids']['external-id'][0]['external-id-url']:
+            link = f"<a href='{url['value']}' target='_blank'>{doi}</a>"
         else:
             link = f"<a href='/doiui/{doi}'>{doi}</a>"
-        inner += f"<tr><td>{date}</td><td>{link}</td>" \
-                 + f"<td>{wsumm['title']['title']['value']}</td></tr>"
-    if inner:
-        html += '<hr>The additional titles below are from ORCID. Note that titles below may ' \
-                + 'be self-reported, and may not have DOIs available</br>'
-        html += '<table id="works" class="tablesorter standard"><thead><tr>' \
-                + '<th>Published</th><th>DOI</th><th>Title</th>' \
-                + f"</tr></thead><tbody>{inner}</tbody></table>"
-    return html
+        inner.append(f"<tr><td>{date}</td><td>{link}</td>" \
+                     + f"<td>{wsumm['title']['title']['value']}</td></tr>")
+    if not inner:
+        return ""
+    return '<hr>The additional titles below are from ORCID. Note that titles below may ' \
+           + 'be self-reported, and may not have DOIs available</br>' \
+           + '<table id="works" class="tablesorter standard"><thead><tr>' \
+           + '<th>Published</th><th>DOI</th><th>Title</th>' \
+           + f"</tr></thead><tbody>{''.join(inner)}</tbody></table>"
 
 
 def generate_user_table(rows):
     ''' Generate a user table
     '''
-    html = '<table id="ops" class="tablesorter standard"><thead><tr>' \
-           + '<th>ORCID</th><th>Given name</th><th>Family name</th>' \
-           + '</tr></thead><tbody>'
+    html = [TABLE_HEAD['user']]
     for row in rows:
         if 'orcid' in row:
             link = f"<a href='/orcidui/{row['orcid']}'>{row['orcid']}</a>"
@@ -453,17 +699,56 @@ def generate_user_table(rows):
             link = f"<a href='/userui/{row['employeeId']}'>No ORCID found</a>"
         else:
             link = 'No ORCID found'
-        html += f"<tr><td>{link}</td><td>{', '.join(row['given'])}</td>" \
-                + f"<td>{', '.join(row['family'])}</td></tr>"
-    html += '</tbody></table>'
-    return html
+        html.append(f"<tr><td>{link}</td><td>{', '.join(row['given'])}</td>" \
+                    + f"<td>{', '.join(row['family'])}</td></tr>")
+    html.append('</tbody></table>')
+    return "".join(html)
 
 # ******************************************************************************
 # * DOI utility functions                                                      *
 # ******************************************************************************
 
+@ttl_cache()
+def get_supervisory_orgs():
+    ''' Get supervisory organizations
+        Keyword arguments:
+          None
+        Returns:
+          Dictionary of supervisory organization codes keyed by name
+    '''
+    return DL.get_supervisory_orgs()
+
+
+@ttl_cache(maxsize=1024)
+def count_tagged_dois(tag):
+    ''' Count the DOIs with a given tag
+        Keyword arguments:
+          tag: tag (affiliation)
+        Returns:
+          Number of DOIs
+    '''
+    return DB['dis'].dois.count_documents({"jrc_tag": tag})
+
+
+@ttl_cache()
+def count_doi_types():
+    ''' Count DOIs by source, type, and subtype
+        Keyword arguments:
+          None
+        Returns:
+          List of counts, most frequent first
+    '''
+    payload = [{"$project": {"_id": 0, "jrc_obtained_from": 1, "type": 1, "subtype": 1}},
+               {"$group": {"_id": {"source": "$jrc_obtained_from", "type": "$type",
+                                   "subtype": "$subtype"},
+                           "count": {"$sum": 1}}},
+               {"$sort" : {"count": -1}}]
+    return list(DB['dis'].dois.aggregate(payload))
+
+
+@ttl_cache(maxsize=1024)
 def get_doi(doi):
-    ''' Add a table of custom JRC fields
+    ''' Get a DOI record from Crossref or DataCite
         Keyword arguments:
           doi: DOI
         Returns:
@@ -489,20 +774,18 @@ def add_jrc_fields(row):
           HTML
     '''
     jrc = {}
-    prog = re.compile("^jrc_")
     for key, val in row.items():
-        if not re.match(prog, key):
+        if not key.startswith("jrc_"):
             continue
         if isinstance(val, list):
             val = ", ".join(val)
         jrc[key] = val
     if not jrc:
         return ""
-    html = '<table class="standard">'
-    for key in sorted(jrc):
-        html += f"<tr><td>{key}</td><td>{jrc[key]}</td></tr>"
-    html += "</table><br>"
-    return html
+    html = ['<table class="standard">']
+    html.extend(f"<tr><td>{key}</td><td>{jrc[key]}</td></tr>" for key in sorted(jrc))
+    html.append("</table><br>")
+    return "".join(html)
 
 
 def add_relations(row):
@@ -512,18 +795,45 @@ def add_relations(row):
         Returns:
           HTML
     '''
-    html = ""
+    html = []
     if ("relation" not in row) or (not row['relation']):
-        return html
+        return ""
     for rel in row['relation']:
-        used = []
+        used = set()
         for itm in row['relation'][rel]:
             if itm['id'] in used:
                 continue
             link = f"<a href='/doiui/{itm['id']}'>{itm['id']}</a>"
-            html += f"This DOI {rel.replace('-', ' ')} {link}<br>"
-            used.append(itm['id'])
-    return html
+            html.append(f"This DOI {rel.replace('-', ' ')} {link}<br>")
+            used.add(itm['id'])
+    return "".join(html)
+
+
+def add_abstract(rec, row):
+    ''' Add a DOI's abstract to a record. Only Crossref abstracts are used.
+        Keyword arguments:
+          rec: record to update
+          row: DOI record
+        Returns:
+          None
+    '''
+    if row.get('jrc_obtained_from') == 'Crossref' and 'abstract' in row:
+        rec['abstract'] = row['abstract']
+
+
+def add_tags(rec, row, orgs):
+    ''' Add a DOI's tags (with supervisory organization codes) to a record
+        Keyword arguments:
+          rec: record to update
+          row: DOI record
+          orgs: dictionary of supervisory organization codes keyed by name
+        Returns:
+          None
+    '''
+    if row.get('jrc_tag'):
+        # dict.fromkeys drops duplicate tags and keeps their order
+        rec['tags'] = [{"name": atag, "code": orgs.get(atag)}
+                       for atag in dict.fromkeys(row['jrc_tag'])]
 
 
 def get_migration_data(doi):
@@ -535,7 +845,7 @@ def get_migration_data(doi):
     '''
     rec = {}
     try:
-        row = DB['dis'].dois.find_one({"doi": doi}, {'_id': 0})
+        row = DB['dis'].dois.find_one({"doi": doi}, DOI_PROJECTION)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
     if not row:
@@ -545,24 +855,14 @@ def get_migration_data(doi):
         authors = DL.get_author_details(row, DB['dis'].orcid)
     except Exception as err:
         raise InvalidUsage("COuld not get author details: " + str(err), 500) from err
-    tagname = []
-    tags = []
     try:
-        orgs = DL.get_supervisory_orgs()
+        orgs = get_supervisory_orgs()
     except Exception as err:
         raise InvalidUsage("Could not get suporgs: " + str(err), 500) from err
-    if 'jrc_tag' in row:
-        for atag in row['jrc_tag']:
-            if atag not in tagname:
-                code = orgs[atag] if atag in orgs else None
-                tagname.append(atag)
-                tags.append({"name": atag, "code": code})
-        if tags:
-            rec['tags'] = tags
+    add_tags(rec, row, orgs)
     rec['authors'] = authors
     # Additional data
-    if row['jrc_obtained_from'] == 'Crossref' and 'abstract' in row:
-        rec['abstract'] = row['abstract']
+    add_abstract(rec, row)
     rec['journal'] = DL.get_journal(row)
     if 'jrc_publishing_date' in row:
         rec['jrc_publishing_date'] = row['jrc_publishing_date']
@@ -592,6 +892,20 @@ def tiny_badge(btype, msg, link=None):
     return html
 
 
+# Author badges as (predicate, badge HTML), in display order
+AUTHOR_BADGES = [(lambda auth: auth['in_database'], tiny_badge('success', 'In database')),
+                 (lambda auth: auth['in_database'] and auth['alumni'],
+                  tiny_badge('danger', 'Alumni')),
+                 (lambda auth: auth['in_database'] and not auth['alumni'] \
+                               and not auth.get('validated'),
+                  tiny_badge('warning', 'Not validated')),
+                 (lambda auth: auth['in_database'] and not auth.get('orcid'),
+                  tiny_badge('urgent', 'No ORCID')),
+                 (lambda auth: not auth['in_database'], tiny_badge('danger', 'Not in database')),
+                 (lambda auth: auth['asserted'], tiny_badge('info', 'Janelia affiliation'))
+                ]
+
+
 def get_badges(auth):
     ''' Create a list of badges for an author
         Keyword arguments:
@@ -599,22 +913,7 @@ def get_badges(auth):
         Returns:
           List of HTML badges
     '''
-    badges = []
-    if auth['in_database']:
-        badges.append(f"{tiny_badge('success', 'In database')}")
-        if auth['alumni']:
-            badges.append(f"{tiny_badge('danger', 'Alumni')}")
-        elif 'validated' not in auth or not auth['validated']:
-            badges.append(f"{tiny_badge('warning', 'Not validated')}")
-        if 'orcid' not in auth or not auth['orcid']:
-            badges.append(f"{tiny_badge('urgent', 'No ORCID')}")
-        if auth['asserted']:
-            badges.append(f"{tiny_badge('info', 'Janelia affiliation')}")
-    else:
-        badges.append(f"{tiny_badge('danger', 'Not in database')}")
-        if auth['asserted']:
-            badges.append(f"{tiny_badge('info', 'Janelia affiliation')}")
-    return badges
+    return [badge for rule, badge in AUTHOR_BADGES if rule(auth)]
 
 
 def show_tagged_authors(authors):
@@ -634,35 +933,35 @@ def show_tagged_authors(authors):
         elif 'employeeId' in auth and auth['employeeId']:
             who = f"<a href='/userui/{auth['employeeId']}'>{who}</a>"
         badges = get_badges(auth)
-        tags = []
+        tags = set(auth.get('tags', []))
         if 'group' in auth:
-            tags.append(auth['group'])
-        if 'tags' in auth:
-            for tag in auth['tags']:
-                if tag not in tags:
-                    tags.append(tag)
-        tags.sort()
+            tags.add(auth['group'])
+        tags = sorted(tags)
         row = f"<td>{who}</td><td>{' '.join(badges)}</td><td>{', '.join(tags)}</td>"
         alist.append(row)
     return f"<table class='borderless'><tr>{'</tr><tr>'.join(alist)}</tr></table>"
 
 
+# orcid collection badges: optional badges (bit 0: no ORCID, bit 1: alumni,
+# bit 2: not validated) and the joined badge HTML for every combination
+ORCID_FLAG_BADGES = (tiny_badge('urgent', 'No ORCID'), tiny_badge('danger', 'Alumni'),
+                     tiny_badge('warning', 'Not validated'))
+ORCID_BADGES = {flags: " ".join([tiny_badge('success', 'In database')]
+                                + [badge for bit, badge in enumerate(ORCID_FLAG_BADGES)
+                                   if flags >> bit & 1])
+                for flags in range(1 << len(ORCID_FLAG_BADGES))}
+
+
 def add_orcid_badges(orc):
     ''' Generate badges for an ORCID ID that is in the orcid collection
         Keyword arguments:
           orc: row from orcid collection
         Returns:
-          List of badges
-    '''
-    badges = []
-    badges.append(tiny_badge('success', 'In database'))
-    if 'orcid' not in orc or not orc['orcid']:
-        badges.append(f"{tiny_badge('urgent', 'No ORCID')}")
-    if 'alumni' in orc:
-        badges.append(tiny_badge('danger', 'Alumni'))
-    if 'employeeId' not in orc:
-        badges.append(tiny_badge('warning', 'Not validated'))
-    return badges
+          Badge HTML
+    '''
+    flags = int(not orc.get('orcid')) | int('alumni' in orc) << 1 \
+            | int('employeeId' not in orc) << 2
+    return ORCID_BADGES[flags]
 
 # ******************************************************************************
 # * General utility functions                                                  *
@@ -673,22 +972,33 @@ def random_string(strlen=8):
         Keyword arguments:
           strlen: length of generated string
     '''
-    components = string.ascii_letters + string.digits
-    return ''.join(random.choice(components) for i in range(strlen))
+    return ''.join(random.choices(RANDOM_CHARS, k=strlen))
 
 
 def create_downloadable(name, header, content):
-    ''' Generate a downloadable content file
+    ''' Generate a downloadable content file. Files older than DOWNLOAD_TTL
+        are removed first.
         Keyword arguments:
           name: base file name
           header: table header
-          content: table content
+          content: iterable of table rows (tab-delimited strings)
         Returns:
-          File name
-    '''
+          Download button HTML
+    '''
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    expired = time() - DOWNLOAD_TTL
+    with os.scandir(DOWNLOAD_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except OSError:
+                # Another worker may have removed it first
+                pass
     fname = f"{name}_{random_string()}_{datetime.today().strftime('%Y%m%d%H%M%S')}.tsv"
-    with open(f"/tmp/{fname}", "w", encoding="utf8") as text_file:
-        text_file.write("\t".join(header) + "\n" + content)
+    with open(os.path.join(DOWNLOAD_DIR, fname), "w", encoding="utf8") as text_file:
+        text_file.write("\t".join(header) + "\n")
+        text_file.writelines(f"{line}\n" for line in content)
     return f'<a class="btn btn-outline-success" href="/download/{fname}" ' \
                 + 'role="button">Download tab-delimited file</a>'
 
@@ -701,11 +1011,9 @@ def humansize(num, suffix='B'):
         Returns:
           string
     '''
-    for unit in ['', 'K', 'M', 'G', 'T']:
-        if abs(num) < 1024.0:
-            return f"{num:.1f}{unit}{suffix}"
-        num /= 1024.0
-    return "{num:.1f}P{suffix}"
+    # Each unit is 2**10 times the last, so the unit index is floor(log2(size)) // 10
+    power = min(max((int(abs(num)).bit_length() - 1) // 10, 0), 5)
+    return f"{num / (1 << (10 * power)):.1f}{('', 'K', 'M', 'G', 'T', 'P')[power]}{suffix}"
 
 
 def dloop(row, keys, sep="\t"):
@@ -720,6 +1028,33 @@ def dloop(row, keys, sep="\t"):
     return sep.join([str(row[fld]) for fld in keys])
 
 
+def collection_stats(cname):
+    ''' Get formatted storage statistics for a collection
+        Keyword arguments:
+          cname: collection name
+        Returns:
+          Tuple of document count, size, free space, and index sizes
+    '''
+    stat = DB['dis'].command('collStats', cname)
+    free = stat['freeStorageSize'] / stat['storageSize'] * 100
+    return (f"{stat['count']:,}", humansize(stat['size']), f"{free:.2f}",
+            ", ".join(f"{key} ({humansize(val)})" for key, val in stat['indexSizes'].items()))
+
+
+@ttl_cache(60)
+def get_collection_stats():
+    ''' Get formatted storage statistics for all collections
+        Keyword arguments:
+          None
+        Returns:
+          Dictionary of collection statistics tuples keyed by collection name
+    '''
+    cnames = DB['dis'].list_collection_names()
+    # collStats is one command per collection, so run them concurrently
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return dict(zip(cnames, executor.map(collection_stats, cnames)))
+
+
 # *****************************************************************************
 # * Documentation                                                             *
 # *****************************************************************************
@@ -766,12 +1101,12 @@ def stats():
     start = datetime.fromtimestamp(app.config['START_TIME']).strftime('%Y-%m-%d %H:%M:%S')
     up_time = datetime.now() - app.config['STARTDT']
     result['stats'] = {"version": __version__,
-                       "requests": app.config['COUNTER'],
+                       "requests": ENDPOINTS.total(),
                        "start_time": start,
                        "uptime": str(up_time),
                        "python": sys.version,
                        "pid": os.getpid(),
-                       "endpoint_counts": app.config['ENDPOINTS'],
+                       "endpoint_counts": ENDPOINTS,
                        "time_since_last_transaction": tbt,
                       }
     return generate_response(result)
@@ -805,32 +1140,23 @@ def show_doi_authors(doi):
     result = initialize_result()
     try:
         coll = DB['dis'].dois
-        row = coll.find_one({"doi": doi}, {'_id': 0})
+        row = coll.find_one({"doi": doi}, CITATION_PROJECTION)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
     if not row:
         result['data'] = []
-        return generate_response(result)
+        return generate_response(result, etag=True)
     try:
         authors = DL.get_author_details(row, DB['dis'].orcid)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
-    tagname = []
-    tags = []
     try:
-        orgs = DL.get_supervisory_orgs()
+        orgs = get_supervisory_orgs()
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
-    if 'jrc_tag' in row:
-        for atag in row['jrc_tag']:
-            if atag not in tagname:
-                code = orgs[atag] if atag in orgs else None
-                tagname.append(atag)
-                tags.append({"name": atag, "code": code})
-        if tags:
-            result['tags'] = tags
+    add_tags(result, row, orgs)
     result['data'] = authors
-    return generate_response(result)
+    return generate_response(result, etag=True)
 
 
 @app.route('/doi/janelians/<path:doi>')
@@ -854,21 +1180,27 @@ def show_doi_janelians(doi):
       500:
         description: MongoDB error
     '''
+    doi = doi.lstrip('/').rstrip('/').lower()
     result = initialize_result()
-    resp = show_doi_authors(doi)
-    data = resp.json
     result['data'] = []
-    tags = []
-    for auth in data['data']:
+    try:
+        row = DB['dis'].dois.find_one({"doi": doi}, CITATION_PROJECTION)
+    except Exception as err:
+        raise InvalidUsage(str(err), 500) from err
+    if not row:
+        return generate_response(result)
+    try:
+        authors = DL.get_author_details(row, DB['dis'].orcid)
+    except Exception as err:
+        raise InvalidUsage(str(err), 500) from err
+    tags = set()
+    for auth in authors:
         if auth['janelian']:
             result['data'].append(auth)
             if 'tags' in auth:
-                for atag in auth['tags']:
-                    if atag not in tags:
-                        tags.append(atag)
+                tags.update(auth['tags'])
     if tags:
-        tags.sort()
-        result['tags'] = tags
+        result['tags'] = sorted(tags)
     return generate_response(result)
 
 
@@ -937,11 +1269,11 @@ def show_doi(doi):
         result['rest']['row_count'] = 1
         result['rest']['source'] = 'mongo'
         result['data'] = row
-        return generate_response(result)
+        return generate_response(result, etag=True)
     result['rest']['source'], result['data'] = get_doi(doi)
     if result['data']:
         result['rest']['row_count'] = 1
-    return generate_response(result)
+    return generate_response(result, etag=True)
 
 
 @app.route('/doi/inserted/<string:idate>')
@@ -959,6 +1291,12 @@ def show_inserted(idate):
           type: string
         required: true
         description: Earliest insertion date in ISO format (YYYY-MM-DD)
+      - in: query
+        name: count_only
+        schema:
+          type: boolean
+        required: false
+        description: Return only the number of matching DOIs
     responses:
       200:
         description: DOI data
@@ -973,18 +1311,20 @@ def show_inserted(idate):
         isodate = datetime.strptime(idate,'%Y-%m-%d')
     except Exception as err:
         raise InvalidUsage(str(err), 400) from err
-    print(isodate)
+    query = {"jrc_inserted": {"$gte" : isodate}}
+    result['rest']['source'] = 'mongo'
+    if count_only_requested():
+        try:
+            result['rest']['row_count'] = coll.count_documents(query)
+        except Exception as err:
+            raise InvalidUsage(str(err), 500) from err
+        result['data'] = []
+        return generate_response(result)
     try:
-        rows = coll.find({"jrc_inserted": {"$gte" : isodate}}, {'_id': 0})
+        rows = coll.find(query, {'_id': 0}).batch_size(BATCH_SIZE)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
-    result['rest']['row_count'] = 0
-    result['rest']['source'] = 'mongo'
-    result['data'] = []
-    for row in rows:
-        result['data'].append(row)
-        result['rest']['row_count'] += 1
-    return generate_response(result)
+    return stream_response(result, rows)
 
 
 @app.route('/citation/<path:doi>')
@@ -1015,7 +1355,7 @@ def show_citation(doi):
     result = initialize_result()
     coll = DB['dis'].dois
     try:
-        row = coll.find_one({"doi": doi}, {'_id': 0})
+        row = coll.find_one({"doi": doi}, CITATION_PROJECTION)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
     if not row:
@@ -1025,7 +1365,7 @@ def show_citation(doi):
     authors = DL.get_author_list(row)
     title = DL.get_title(row)
     result['data'] = f"{authors} {title}. https://doi.org/{doi}."
-    return generate_response(result)
+    return generate_response(result, etag=True)
 
 
 @app.route('/citations', defaults={'ctype': 'dis'}, methods=['OPTIONS', 'POST'])
@@ -1062,12 +1402,15 @@ def show_multiple_citations(ctype='dis'):
         raise InvalidUsage("You must specify a list of DOIs")
     result['rest']['source'] = 'mongo'
     result['data'] = {}
-    coll = DB['dis'].dois
+    dlist = list(dict.fromkeys(doi.lower() for doi in ipd['dois']))
+    try:
+        rows = DB['dis'].dois.find({"doi": {"$in": dlist}}, CITATION_PROJECTION) \
+                             .batch_size(BATCH_SIZE)
+        by_doi = {row['doi']: row for row in rows}
+    except Exception as err:
+        raise InvalidUsage(str(err), 500) from err
     for doi in ipd['dois']:
-        try:
-            row = coll.find_one({"doi": doi.tolower()}, {'_id': 0})
-        except Exception as err:
-            raise InvalidUsage(str(err), 500) from err
+        row = by_doi.get(doi.lower())
         if not row:
             result['data'][doi] = ''
             continue
@@ -1109,7 +1452,7 @@ def show_flylight_citation(doi):
     result = initialize_result()
     coll = DB['dis'].dois
     try:
-        row = coll.find_one({"doi": doi}, {'_id': 0})
+        row = coll.find_one({"doi": doi}, CITATION_PROJECTION)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
     if not row:
@@ -1150,7 +1493,7 @@ def show_components(doi):
     result = initialize_result()
     coll = DB['dis'].dois
     try:
-        row = coll.find_one({"doi": doi}, {'_id': 0})
+        row = coll.find_one({"doi": doi}, DOI_PROJECTION)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
     if not row:
@@ -1162,9 +1505,8 @@ def show_components(doi):
                       "publishing_date": DL.get_publishing_date(row),
                       "title": DL.get_title(row)
                      }
-    if row['jrc_obtained_from'] == 'Crossref' and 'abstract' in row:
-        result['data']['abstract'] = row['abstract']
-    return generate_response(result)
+    add_abstract(result['data'], row)
+    return generate_response(result, etag=True)
 
 
 @app.route('/doi/custom', methods=['OPTIONS', 'POST'])
@@ -1182,6 +1524,12 @@ def show_dois_custom():
           type: string
         required: true
         description: MongoDB query
+      - in: query
+        name: count_only
+        schema:
+          type: boolean
+        required: false
+        description: Return only the number of matching DOIs
     responses:
       200:
         description: DOI data
@@ -1196,12 +1544,16 @@ def show_dois_custom():
     result['rest']['query'] = ipd['query']
     result['data'] = []
     coll = DB['dis'].dois
+    if count_only_requested():
+        try:
+            result['rest']['row_count'] = coll.count_documents(ipd['query'])
+        except Exception as err:
+            raise InvalidUsage(str(err), 500) from err
+        return generate_response(result)
     try:
         rows = coll.find(ipd['query'], {'_id': 0})
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
-    if not rows:
-        generate_response(result)
     for row in rows:
         result['data'].append(row)
         result['rest']['row_count'] += 1
@@ -1244,11 +1596,9 @@ def show_multiple_components(ctype='dis'):
     result['data'] = []
     coll = DB['dis'].dois
     try:
-        rows = coll.find({"jrc_tag": ipd['tag']}, {'_id': 0})
+        rows = coll.find({"jrc_tag": ipd['tag']}, DOI_PROJECTION).batch_size(BATCH_SIZE)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
-    if not rows:
-        generate_response(result)
     for row in rows:
         record = {"doi": row['doi'],
                   "authors": DL.get_author_list(row, style=ctype, returntype="list"),
@@ -1256,8 +1606,7 @@ def show_multiple_components(ctype='dis'):
                   "journal": DL.get_journal(row),
                   "publishing_date": DL.get_publishing_date(row)
                  }
-        if row['jrc_obtained_from'] == 'Crossref' and 'abstract' in row:
-            record['abstract'] = row['abstract']
+        add_abstract(record, row)
         result['data'].append(record)
         result['rest']['row_count'] += 1
     return generate_response(result)
@@ -1279,7 +1628,8 @@ def show_types():
     '''
     result = initialize_result()
     coll = DB['dis'].dois
-    payload = [{"$group": {"_id": {"type": "$type", "subtype": "$subtype"},"count": {"$sum": 1}}}]
+    payload = [{"$project": {"_id": 0, "type": 1, "subtype": 1}},
+               {"$group": {"_id": {"type": "$type", "subtype": "$subtype"},"count": {"$sum": 1}}}]
     try:
         rows = coll.aggregate(payload)
     except Exception as err:
@@ -1318,7 +1668,7 @@ def show_oids():
     result = initialize_result()
     try:
         coll = DB['dis'].orcid
-        rows = coll.find({}, {'_id': 0}).collation({"locale": "en"}).sort("family", 1)
+        rows = coll.find({}, {'_id': 0}).collation(EN_COLLATION).sort("family", 1)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
     result['rest']['source'] = 'mongo'
@@ -1351,22 +1701,25 @@ def show_oid(oid):
         description: MongoDB error
     '''
     result = initialize_result()
-    if re.match(r'([0-9A-Z]{4}-){3}[0-9A-Z]+', oid):
-        payload = {"orcid": oid}
-    else:
-        payload = {"$or": [{"family": {"$regex": oid, "$options" : "i"}},
-                           {"given": {"$regex": oid, "$options" : "i"}}]
-                  }
+    coll = DB['dis'].orcid
     try:
-        coll = DB['dis'].orcid
-        rows = coll.find(payload, {'_id': 0})
+        if ORCID_RE.match(oid):
+            rows = list(coll.find({"orcid": oid}, {'_id': 0}))
+        else:
+            # Whole-name matches can use the case-insensitive name indexes; only
+            # fall back to a (collection scan) substring search if there are none
+            rows = list(coll.find({"$or": [{"family": oid}, {"given": oid}]}, {'_id': 0}) \
+                            .collation(NAME_COLLATION))
+            if not rows:
+                payload = {"$or": [{"family": {"$regex": oid, "$options" : "i"}},
+                                   {"given": {"$regex": oid, "$options" : "i"}}]
+                          }
+                rows = list(coll.find(payload, {'_id': 0}))
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
     result['rest']['source'] = 'mongo'
-    result['data'] = []
-    for row in rows:
-        result['data'].append(row)
-    return generate_response(result)
+    result['data'] = rows
+    return generate_response(result, etag=True)
 
 
 @app.route('/orcidapi/<string:oid>')
@@ -1389,10 +1742,8 @@ def show_oidapi(oid):
         description: ORCID data
     '''
     result = initialize_result()
-    url = f"https://pub.orcid.org/v3.0/{oid}"
     try:
-        resp = requests.get(url, headers={"Accept": "application/json"}, timeout=10)
-        result['data'] = resp.json()
+        result['data'] = get_orcid_record(oid)
     except Exception as err:
         raise InvalidUsage(str(err), 500) from err
     if 'error-code' not in result['data']:
@@ -1409,7 +1760,8 @@ def download(fname):
     ''' Downloadable content
     '''
     try:
-        return send_file('/tmp/' + fname, download_name=fname)  # pylint: disable=E1123
+        path = os.path.join(DOWNLOAD_DIR, fname)
+        return send_file(path, download_name=fname)  # pylint: disable=E1123
     except Exception as err:
         return render_template("error.html", urlroot=request.url_root,
                                title='Download error', message=err)
@@ -1442,7 +1794,9 @@ def show_doi_ui(doi):
     else:
         html = '<h5 style="color:red">This DOI is not saved locally in the ' \
                + 'Janelia database</h5><br>'
-    _, data = get_doi(doi)
+    # Saved DOIs are stored as Crossref/DataCite returned them, so only DOIs
+    # that aren't saved need to be fetched
+    data = row if row else get_doi(doi)[1]
     if not data:
         return render_template('warning.html', urlroot=request.url_root,
                                 title=render_warning("Could not find DOI", 'warning'),
@@ -1491,29 +1845,20 @@ def show_doi_ui(doi):
 def dois_type():
     ''' Show data types
     '''
-    payload = [{"$group": {"_id": {"source": "$jrc_obtained_from", "type": "$type",
-                                   "subtype": "$subtype"},
-                           "count": {"$sum": 1}}},
-               {"$sort" : {"count": -1}}]
     try:
-        coll = DB['dis'].dois
-        rows = coll.aggregate(payload)
+        rows = count_doi_types()
     except Exception as err:
         return render_template('error.html', urlroot=request.url_root,
                                title=render_warning("Could not get types from dois collection"),
                                message=error_message(err))
-    html = '<table id="types" class="tablesorter standard"><thead><tr>' \
-           + '<th>Source</th><th>Type</th><th>Subtype</th><th>Count</th>' \
-           + '</tr></thead><tbody>'
+    html = [TABLE_HEAD['type']]
     for row in rows:
-        for field in ('source', 'type', 'subtype'):
-            if field not in row['_id']:
-                row['_id'][field] = ''
-        html += f"<tr><td>{row['_id']['source']}</td><td>{row['_id']['type']}</td>" \
-                + f"<td>{row['_id']['subtype']}</td><td>{row['count']:,}</td></tr>"
-    html += '</tbody></table>'
+        rid = row['_id']
+        html.append(f"<tr><td>{rid.get('source', '')}</td><td>{rid.get('type', '')}</td>" \
+                    + f"<td>{rid.get('subtype', '')}</td><td>{row['count']:,}</td></tr>")
+    html.append('</tbody></table>')
     response = make_response(render_template('general.html', urlroot=request.url_root,
-                                             title="DOI types", html=html,
+                                             title="DOI types", html="".join(html),
                                              navbar=generate_navbar('DOIs')))
     return response
 
@@ -1522,7 +1867,8 @@ def dois_type():
 def dois_publisher():
     ''' Show publishers with counts
     '''
-    payload = [{"$group": {"_id": {"publisher": "$publisher"},
+    payload = [{"$project": {"_id": 0, "publisher": 1}},
+               {"$group": {"_id": {"publisher": "$publisher"},
                            "count": {"$sum": 1}}},
                {"$sort" : {"count": -1}}]
     try:
@@ -1533,16 +1879,14 @@ def dois_publisher():
                                title=render_warning("Could not get publishers " \
                                                     + "from dois collection"),
                                message=error_message(err))
-    html = '<table id="types" class="tablesorter standard"><thead><tr>' \
-           + '<th>Publisher</th><th>Count</th>' \
-           + '</tr></thead><tbody>'
+    html = [TABLE_HEAD['publisher']]
     for row in rows:
         onclick = "onclick='nav_post(\"publisher\",\"" + row['_id']['publisher'] + "\")'"
         link = f"<a href='#' {onclick}>{row['_id']['publisher']}</a>"
-        html += f"<tr><td>{link}</td><td>{row['count']:,}</td></tr>"
-    html += '</tbody></table>'
+        html.append(f"<tr><td>{link}</td><td>{row['count']:,}</td></tr>")
+    html.append('</tbody></table>')
     response = make_response(render_template('general.html', urlroot=request.url_root,
-                                             title="DOI publishers", html=html,
+                                             title="DOI publishers", html="".join(html),
                                              navbar=generate_navbar('DOIs')))
     return response
 
@@ -1551,8 +1895,10 @@ def dois_publisher():
 def dois_tag():
     ''' Show tags with counts
     '''
-    payload = [{"$unwind" : "$jrc_tag"},
+    # Only tagged DOIs (served by the jrc_tag index) are trimmed and unwound
+    payload = [{"$match": {"jrc_tag": {"$exists": True}}},
                {"$project": {"_id": 0, "jrc_tag": 1}},
+               {"$unwind" : "$jrc_tag"},
                {"$group": {"_id": {"tag": "$jrc_tag"}, "count":{"$sum": 1}}},
                {"$sort": {"_id.tag": 1}}
               ]
@@ -1563,16 +1909,14 @@ def dois_tag():
         return render_template('error.html', urlroot=request.url_root,
                                title=render_warning("Could not get tags from dois collection"),
                                message=error_message(err))
-    html = '<table id="types" class="tablesorter standard"><thead><tr>' \
-           + '<th>Tag</th><th>Count</th>' \
-           + '</tr></thead><tbody>'
+    html = [TABLE_HEAD['tag']]
     for row in rows:
         onclick = "onclick='nav_post(\"jrc_tag\",\"" + row['_id']['tag'] + "\")'"
         link = f"<a href='#' {onclick}>{row['_id']['tag']}</a>"
-        html += f"<tr><td>{link}</td><td>{row['count']:,}</td></tr>"
-    html += '</tbody></table>'
+        html.append(f"<tr><td>{link}</td><td>{row['count']:,}</td></tr>")
+    html.append('</tbody></table>')
     response = make_response(render_template('general.html', urlroot=request.url_root,
-                                             title="DOI publishers", html=html,
+                                             title="DOI publishers", html="".join(html),
                                              navbar=generate_navbar('DOIs')))
     return response
 
@@ -1621,21 +1965,22 @@ def show_doiui_custom():
                                title=render_warning("DOIs not found"),
                                message=f"No DOIs were found for {ipd['field']}={ipd['value']}")
     header = ['Published', 'DOI', 'Title']
-    html = "<table id='dois' class='tablesorter standard'><thead><tr>" \
-           + ''.join([f"<th>{itm}</th>" for itm in header]) + "</tr></thead><tbody>"
+    html = ["<table id='dois' class='tablesorter standard'><thead><tr>" \
+            + ''.join([f"<th>{itm}</th>" for itm in header]) + "</tr></thead><tbody>"]
     works = []
     for row in rows:
         published = DL.get_publishing_date(row)
         title = DL.get_title(row)
         link = f"<a href='/doiui/{row['doi']}'>{row['doi']}</a>"
         works.append({"published": published, "link": link, "title": title, "doi": row['doi']})
-    fileoutput = ""
+    fileoutput = []
     for row in sorted(works, key=lambda row: row['published'], reverse=True):
-        html += "<tr><td>" + dloop(row, ['published', 'link', 'title'], "</td><td>") + "</td></tr>"
+        html.append("<tr><td>" + dloop(row, ['published', 'link', 'title'], "</td><td>") \
+                    + "</td></tr>")
         row['title'] = row['title'].replace("\n", " ")
-        fileoutput += dloop(row, ['published', 'doi', 'title']) + "\n"
-    html += '</tbody></table>'
-    html = create_downloadable(ipd['field'], header, fileoutput) + html
+        fileoutput.append(dloop(row, ['published', 'doi', 'title']))
+    html.append('</tbody></table>')
+    html = create_downloadable(ipd['field'], header, fileoutput) + "".join(html)
     response = make_response(render_template('general.html', urlroot=request.url_root,
                                              title=f"DOIs for {ipd['field']} {ipd['value']}",
                                              html=html, navbar=generate_navbar('DOIs')))
@@ -1650,9 +1995,7 @@ def show_oid_ui(oid):
     ''' Show ORCID user
     '''
     try:
-        resp = requests.get(f"https://pub.orcid.org/v3.0/{oid}",
-                            headers={"Accept": "application/json"}, timeout=10)
-        data = resp.json()
+        data = get_orcid_record(oid)
     except Exception as err:
         return render_template('error.html', urlroot=request.url_root,
                                title=render_warning("Could not retrieve ORCID ID"),
@@ -1712,21 +2055,27 @@ def show_user_ui(eid):
 def show_names_ui(name):
     ''' Show user names
     '''
-    payload = {"$or": [{"family": {"$regex": name, "$options" : "i"}},
-                       {"given": {"$regex": name, "$options" : "i"}},
-                      ]}
     try:
-        coll = DB['dis'].orcid
-        if not coll.count_documents(payload):
-            return render_template('warning.html', urlroot=request.url_root,
-                                   title=render_warning("Could not find name", 'warning'),
-                                    message=f"Could not find any name matching {name}")
-        rows = coll.find(payload).collation({"locale": "en"}).sort("family", 1)
+        # Whole-word match on the text index first, best matches first
+        first, rows = text_search_names(name)
+        if not first:
+            # Fall back to names starting with the (literal) search term
+            prefix = f"^{re.escape(name)}"
+            payload = {"$or": [{"family": {"$regex": prefix, "$options" : "i"}},
+                               {"given": {"$regex": prefix, "$options" : "i"}},
+                              ]}
+            rows = DB['dis'].orcid.find(payload, USER_PROJECTION).collation(EN_COLLATION) \
+                                  .sort("family", 1).batch_size(BATCH_SIZE)
+            first = next(rows, None)
     except Exception as err:
         return render_template('error.html', urlroot=request.url_root,
-                               title=render_warning("Could not count names in dois collection"),
+                               title=render_warning("Could not find names in orcid collection"),
                                message=error_message(err))
-    html = generate_user_table(rows)
+    if not first:
+        return render_template('warning.html', urlroot=request.url_root,
+                               title=render_warning("Could not find name", 'warning'),
+                               message=f"Could not find any name matching {name}")
+    html = generate_user_table(chain([first], rows))
     response = make_response(render_template('general.html', urlroot=request.url_root,
                                              title=f"Search term: {name}", html=html,
                                              navbar=generate_navbar('ORCID')))
@@ -1737,27 +2086,20 @@ def show_names_ui(name):
 def orcid_tag():
     ''' Show ORCID tags (affiliations) with counts
     '''
-    payload = [{"$unwind" : "$affiliations"},
-               {"$project": {"_id": 0, "affiliations": 1}},
-               {"$group": {"_id": {"affiliation": "$affiliations"}, "count":{"$sum": 1}}},
-               {"$sort": {"_id.affiliation": 1}}
-              ]
     try:
-        rows = DB['dis'].orcid.aggregate(payload)
+        rows = count_affiliations()
     except Exception as err:
         return render_template('error.html', urlroot=request.url_root,
                                title=render_warning("Could not get affiliations " \
                                                     + "from orcid collection"),
                                message=error_message(err))
-    html = '<table id="types" class="tablesorter standard"><thead><tr>' \
-           + '<th>Affiliation</th><th>Count</th>' \
-           + '</tr></thead><tbody>'
+    html = [TABLE_HEAD['affiliation']]
     for row in rows:
-        link = f"<a href='/affiliation/{row['_id']['affiliation']}'>{row['_id']['affiliation']}</a>"
-        html += f"<tr><td>{link}</td><td>{row['count']:,}</td></tr>"
-    html += '</tbody></table>'
+        link = f"<a href='/affiliation/{row['_id']}'>{row['_id']}</a>"
+        html.append(f"<tr><td>{link}</td><td>{row['count']:,}</td></tr>")
+    html.append('</tbody></table>')
     response = make_response(render_template('general.html', urlroot=request.url_root,
-                                             title="ORCID affiliations", html=html,
+                                             title="ORCID affiliations", html="".join(html),
                                              navbar=generate_navbar('DOIs')))
     return response
 
@@ -1766,18 +2108,16 @@ def orcid_tag():
 def orcid_affiliation(aff):
     ''' Show ORCID tags (affiliations) with counts
     '''
-    payload = {"jrc_tag": aff}
     try:
-        cnt = DB['dis'].dois.count_documents(payload)
+        cnt = count_tagged_dois(aff)
     except Exception as err:
         return render_template('error.html', urlroot=request.url_root,
                                title=render_warning("Could not count affiliations " \
                                                     + "in dois collection"),
                                message=error_message(err))
     html = f"<p>Number of tagged DOIs: {cnt:,}</p>"
-    payload = {"affiliations": aff}
     try:
-        rows = DB['dis'].orcid.find(payload).collation({"locale": "en"}).sort("family", 1)
+        rows = get_affiliated_users(aff)
     except Exception as err:
         return render_template('error.html', urlroot=request.url_root,
                                title=render_warning("Could not get affiliations from " \
@@ -1797,33 +2137,19 @@ def orcid_affiliation(aff):
 def stats_database():
     ''' Show database stats
     '''
-    collection = {}
     try:
-        cnames = DB['dis'].list_collection_names()
-        for cname in cnames:
-            stat = DB['dis'].command('collStats', cname)
-            indices = []
-            for key, val in stat['indexSizes'].items():
-                indices.append(f"{key} ({humansize(val)})")
-            free = stat['freeStorageSize'] / stat['storageSize'] * 100
-            collection[cname] = {"docs": f"{stat['count']:,}",
-                                 "size": humansize(stat['size']),
-                                 "free": f"{free:.2f}",
-                                 "idx": ", ".join(indices)
-                                }
+        collection = get_collection_stats()
     except Exception as err:
         return render_template('error.html', urlroot=request.url_root,
                                title=render_warning("Could not get collection stats"),
                                message=error_message(err))
-    html = '<table id="collections" class="tablesorter standard"><thead><tr>' \
-           + '<th>Collection</th><th>Documents</th><th>Size</th><th>Free space</th>' \
-           + '<th>Indices</th></tr></thead><tbody>'
-    for coll, val in sorted(collection.items()):
-        html += f"<tr><td>{coll}</td><td>" + dloop(val, ['docs', 'size', 'free', 'idx'],
-                                                   "</td><td>") + "</td></tr>"
-    html += '</tbody></table>'
+    html = [TABLE_HEAD['collection']]
+    html.extend(f"<tr><td>{coll}</td><td>{docs}</td><td>{size}</td><td>{free}</td>" \
+                + f"<td>{idx}</td></tr>"
+                for coll, (docs, size, free, idx) in sorted(collection.items()))
+    html.append('</tbody></table>')
     response = make_response(render_template('general.html', urlroot=request.url_root,
-                                             title="Database statistics", html=html,
+                                             title="Database statistics", html="".join(html),
                                              navbar=generate_navbar('Stats')))
     return response
 
@@ -1850,8 +2176,11 @@ def show_groups():
                          and 'html' in request.headers['Accept'] else 'json'
     coll = DB['dis'].orcid
     payload = {"group": {"$exists": True}}
+    # The HTML table only shows names, ORCID, group, and affiliations
+    project = {'_id': 0} if expected == 'json' \
+              else {'_id': 0, 'given': 1, 'family': 1, 'orcid': 1, 'group': 1, 'affiliations': 1}
     try:
-        rows = coll.find(payload, {'_id': 0}).sort("group", 1)
+        rows = coll.find(payload, project).sort("group", 1).batch_size(BATCH_SIZE)
     except Exception as err:
         if expected == 'html':
             return render_template('error.html', urlroot=request.url_root,
@@ -1860,24 +2189,16 @@ def show_groups():
         raise InvalidUsage(str(err), 500) from err
     if expected == 'json':
         result['rest']['source'] = 'mongo'
-        result['data'] = []
-        for row in rows:
-            result['data'].append(row)
-        result['rest']['row_count'] = len(result['data'])
-        return generate_response(result)
-    html = '<table class="standard"><thead><tr><th>Name</th><th>ORCID</th><th>Group</th>' \
-           + '<th>Affiliations</th></tr></thead><tbody>'
+        return stream_response(result, rows)
+    html = [TABLE_HEAD['group']]
     for row in rows:
-        print(row)
-        if 'affiliations' not in row:
-            row['affiliations'] = ''
         link = f"<a href='/orcidui/{row['orcid']}'>{row['orcid']}</a>" if 'orcid' in row else ''
-        html += f"<tr><td>{row['given'][0]} {row['family'][0]}</td>" \
-                + f"<td style='width: 180px'>{link}</td><td>{row['group']}</td>" \
-                + f"<td>{', '.join(row['affiliations'])}</td></tr>"
-    html += '</tbody></table>'
-    return render_template('general.html', urlroot=request.url_root, title='Groups', html=html,
-                           navbar=generate_navbar('ORCID'))
+        html.append(f"<tr><td>{row['given'][0]} {row['family'][0]}</td>" \
+                    + f"<td style='width: 180px'>{link}</td><td>{row['group']}</td>" \
+                    + f"<td>{', '.join(row.get('affiliations', []))}</td></tr>")
+    html.append('</tbody></table>')
+    return render_template('general.html', urlroot=request.url_root, title='Groups',
+                           html="".join(html), navbar=generate_navbar('ORCID'))
 
 # *****************************************************************************
 
@@ -0,0 +1,121 @@
+''' create_indexes.py
+    Create the MongoDB indexes that the DIS UI/REST API queries rely on.
+    Indexes that already exist (by name) are left alone, so this is safe to
+    rerun. Run without --write first to see what would be created.
+'''
+import argparse
+from operator import attrgetter
+import sys
+import jrc_common.jrc_common as JRC
+
+# pylint: disable=broad-exception-caught,logging-fstring-interpolation
+
+# Database
+DB = {}
+# Case-insensitive comparison for names (must match the API's NAME_COLLATION)
+NAME_COLLATION = {"locale": "en", "strength": 2}
+# Indexes by collection: (keys, options). Indexes with a collation need an
+# explicit name, since the default name doesn't include the collation.
+INDEXES = {"dois": [([("doi", 1)], {"unique": True}),
+                    ([("jrc_inserted", 1)], {}),
+                    ([("jrc_tag", 1)], {}),
+                    ([("jrc_author", 1), ("jrc_inserted", 1)], {}),
+                    ([("author.family", 1), ("author.given", 1)], {}),
+                    ([("creators.familyName", 1), ("creators.givenName", 1)], {})
+                   ],
+           "orcid": [([("orcid", 1)], {}),
+                     ([("group", 1)], {}),
+                     ([("family", 1)], {"name": "family_ci", "collation": NAME_COLLATION}),
+                     ([("given", 1)], {"name": "given_ci", "collation": NAME_COLLATION}),
+                     ([("given", "text"), ("family", "text")], {})
+                    ]
+          }
+# Counters
+COUNT = {"existing": 0, "created": 0, "error": 0}
+
+def terminate_program(msg=None):
+    ''' Terminate the program gracefully
+        Keyword arguments:
+          msg: error message
+        Returns:
+          None
+    '''
+    if msg:
+        LOGGER.critical(msg)
+    sys.exit(-1 if msg else 0)
+
+
+def initialize_program():
+    ''' Intialize the program
+        Keyword arguments:
+          None
+        Returns:
+          None
+    '''
+    # Database
+    try:
+        dbconfig = JRC.get_config("databases")
+    except Exception as err:
+        terminate_program(err)
+    dbs = ['dis']
+    for source in dbs:
+        dbo = attrgetter(f"{source}.{ARG.MANIFOLD}.write")(dbconfig)
+        LOGGER.info("Connecting to %s %s on %s as %s", dbo.name, ARG.MANIFOLD, dbo.host, dbo.user)
+        try:
+            DB[source] = JRC.connect_database(dbo)
+        except Exception as err:
+            terminate_program(err)
+
+
+def create_indexes():
+    ''' Create any missing indexes
+        Keyword arguments:
+          None
+        Returns:
+          None
+    '''
+    for cname, indexes in INDEXES.items():
+        coll = DB['dis'][cname]
+        try:
+            existing = coll.index_information()
+        except Exception as err:
+            terminate_program(err)
+        for keys, options in indexes:
+            name = options.get('name') or '_'.join(f"{key}_{direction}" for key, direction in keys)
+            if name in existing:
+                LOGGER.debug(f"Index {name} already exists on {cname}")
+                COUNT['existing'] += 1
+                continue
+            LOGGER.info(f"Creating index {name} on {cname}")
+            if not ARG.WRITE:
+                continue
+            try:
+                coll.create_index(keys, **{"name": name, **options})
+                COUNT['created'] += 1
+            except Exception as err:
+                LOGGER.error(f"Could not create index {name} on {cname}: {err}")
+                COUNT['error'] += 1
+    print(f"Indexes already present: {COUNT['existing']}")
+    print(f"Indexes created:         {COUNT['created']}")
+    if COUNT['error']:
+        print(f"Indexes with errors:     {COUNT['error']}")
+
+# -----------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(
+        description="Create indexes used by the DIS UI/REST API")
+    PARSER.add_argument('--manifold', dest='MANIFOLD', action='store',
+                        default='prod', choices=['dev', 'prod'],
+                        help='MongoDB manifold (dev, prod)')
+    PARSER.add_argument('--write', dest='WRITE', action='store_true',
+                        default=False, help='Write to database/config system')
+    PARSER.add_argument('--verbose', dest='VERBOSE', action='store_true',
+                        default=False, help='Flag, Chatty')
+    PARSER.add_argument('--debug', dest='DEBUG', action='store_true',
+                        default=False, help='Flag, Very chatty')
+    ARG = PARSER.parse_args()
+    LOGGER = JRC.setup_logging(ARG)
+    initialize_program()
+    create_indexes()
+    terminate_program()